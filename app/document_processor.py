@@ -4,23 +4,74 @@ Handles parsing, chunking, and text extraction from various document formats
 """
 
 import os
-import hashlib
-from typing import List, Dict, Tuple
-import PyPDF2
+import re
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from typing import BinaryIO, List, Dict, Tuple, Union
+import numpy as np
+import blake3
+import pypdfium2 as pdfium
 from docx import Document
 import io
 
 
+# Sentence separator: whitespace following a sentence ending
+_SENT_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+
+# PDFs with at least this many pages have their text extracted in parallel
+PARALLEL_PDF_MIN_PAGES = 50
+
+# Block size for hashing and reading file streams
+STREAM_BLOCK_SIZE = 1 << 20
+
+# PDFium is not thread-safe and uploads are processed on worker threads:
+# every PDFium call in this process goes through this lock
+_pdfium_lock = threading.Lock()
+
+
+def _extract_pdf_pages(content: bytes, start: int, stop: int) -> List[str]:
+    """Extract text of pages [start, stop); module-level so worker processes can run it"""
+    pdf = pdfium.PdfDocument(content)
+    try:
+        return [pdf[i].get_textpage().get_text_range() for i in range(start, stop)]
+    finally:
+        pdf.close()
+
+
+# Shared worker pool for large PDFs, created on first use. Workers are spawned rather
+# than forked: uploads run on threads of a process that also runs model and PDFium
+# threads, and a forked child could inherit locks held mid-operation.
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Return the shared PDF extraction pool, starting it if needed"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=min(os.cpu_count() or 1, 8),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pdf_pool
+
+
 class DocumentProcessor:
     """Processes documents (PDF, DOCX, TXT) and creates intelligent chunks"""
     
+    __slots__ = ('upload_dir',)
+    
     def __init__(self):
         self.upload_dir = "uploads"
         os.makedirs(self.upload_dir, exist_ok=True)
     
     def process_document(
         self, 
-        content: bytes, 
+        content: Union[bytes, BinaryIO], 
         filename: str, 
         file_type: str
     ) -> Tuple[str, List[Dict], str]:
@@ -28,7 +79,7 @@ class DocumentProcessor:
         Process document and return document_id, chunks, and full text
         
         Args:
-            content: File content as bytes
+            content: File content as bytes or a seekable binary stream
             filename: Original filename
             file_type: File extension (.pdf, .docx, .txt)
         
@@ -41,7 +92,7 @@ class DocumentProcessor:
         elif file_type == '.docx':
             text = self._extract_docx_text(content)
         elif file_type == '.txt':
-            text = content.decode('utf-8')
+            text = self._read_bytes(content).decode('utf-8')
         else:
             raise ValueError(f"Unsupported file type: {file_type}")
         
@@ -53,32 +104,85 @@ class DocumentProcessor:
         
         return document_id, chunks, text
     
-    def _extract_pdf_text(self, content: bytes) -> str:
+    def _read_bytes(self, content: Union[bytes, BinaryIO]) -> bytes:
+        """Return the full content of bytes or a stream"""
+        if isinstance(content, bytes):
+            return content
+        content.seek(0)
+        return content.read()
+    
+    def _extract_pdf_text(self, content: Union[bytes, BinaryIO]) -> str:
         """Extract text from PDF"""
         try:
-            pdf_file = io.BytesIO(content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text.strip()
+            if not hasattr(content, "readinto"):
+                # PDFium needs readinto(); SpooledTemporaryFile only has it on Python 3.11+
+                content = self._read_bytes(content)
+            elif not isinstance(content, bytes):
+                content.seek(0)  # PDFium reads the stream in place, without a copy
+            pages = None
+            with _pdfium_lock:
+                pdf = pdfium.PdfDocument(content)
+                try:
+                    page_count = len(pdf)
+                    workers = min(os.cpu_count() or 1, 8, page_count // 10)
+                    if page_count < PARALLEL_PDF_MIN_PAGES or workers < 2:
+                        pages = [page.get_textpage().get_text_range() for page in pdf]
+                finally:
+                    pdf.close()
+            
+            # Large PDFs: worker processes each have their own PDFium, so the lock is not held
+            if pages is None:
+                pages = self._extract_pdf_pages_parallel(self._read_bytes(content), page_count, workers)
+            # PDFium separates lines with CRLF (the rest of the pipeline is line-based on "\n")
+            # and reports soft hyphens at line breaks as the noncharacter U+FFFE
+            return "\n".join(pages).replace("\r\n", "\n").replace("\ufffe", "-").strip()
         except Exception as e:
             raise ValueError(f"Error extracting PDF text: {str(e)}")
     
-    def _extract_docx_text(self, content: bytes) -> str:
+    def _extract_pdf_pages_parallel(self, content: bytes, page_count: int, workers: int) -> List[str]:
+        """Extract page text across worker processes (PDFium is not thread-safe)"""
+        global _pdf_pool
+        bounds = [page_count * i // workers for i in range(workers + 1)]
+        pool = _get_pdf_pool()
+        try:
+            results = pool.map(_extract_pdf_pages, repeat(content), bounds[:-1], bounds[1:])
+            return [text for page_texts in results for text in page_texts]
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM-killed): drop the pool so the next large PDF gets a fresh one
+            print(f"PDF worker pool broke: {e}, extracting serially")
+            with _pdf_pool_lock:
+                if _pdf_pool is pool:
+                    _pdf_pool = None
+            pool.shutdown(wait=False)
+            with _pdfium_lock:
+                return _extract_pdf_pages(content, 0, page_count)
+    
+    def _extract_docx_text(self, content: Union[bytes, BinaryIO]) -> str:
         """Extract text from DOCX"""
         try:
-            docx_file = io.BytesIO(content)
+            if isinstance(content, bytes):
+                docx_file = io.BytesIO(content)
+            else:
+                docx_file = content
+                docx_file.seek(0)
             doc = Document(docx_file)
             text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
             return text.strip()
         except Exception as e:
             raise ValueError(f"Error extracting DOCX text: {str(e)}")
     
-    def _generate_document_id(self, content: bytes, filename: str) -> str:
+    def _generate_document_id(self, content: Union[bytes, BinaryIO], filename: str) -> str:
         """Generate unique document ID"""
-        hash_input = content + filename.encode('utf-8')
-        return hashlib.md5(hash_input).hexdigest()
+        # Hash content and filename incrementally to avoid copying the file bytes
+        hasher = blake3.blake3()
+        if isinstance(content, bytes):
+            hasher.update(content)
+        else:
+            content.seek(0)
+            while block := content.read(STREAM_BLOCK_SIZE):
+                hasher.update(block)
+        hasher.update(filename.encode('utf-8'))
+        return hasher.hexdigest()[:32]
     
     def _chunk_text(
         self, 
@@ -98,52 +202,63 @@ class DocumentProcessor:
         if not text:
             return []
         
-        # Split into sentences
+        # Split into sentences (as character spans into the original text)
         sentences = self._split_into_sentences(text)
+        if not sentences:
+            return []
         
-        chunks = []
-        current_chunk = []
-        current_length = 0
+        # Count words once per sentence; prefix sums give any window's length in O(1).
+        # Counts stay exact (str.split): extracted PDF text wraps sentences across
+        # lines, so a space-count estimate would undercount and oversize chunks.
+        word_counts = np.fromiter(
+            (len(text[start:end].split()) for start, end in sentences),
+            dtype=np.int64,
+            count=len(sentences)
+        )
+        cum_words = np.concatenate(([0], np.cumsum(word_counts)))
         
-        for i, sentence in enumerate(sentences):
-            sentence_length = len(sentence.split())
+        chunks = []
+        first = 0  # First sentence of the current window
+        min_end = 1  # Window always includes sentences before this index
+        while True:
+            # Extend window with whole sentences while it stays within chunk_size words
+            end = int(np.searchsorted(cum_words, cum_words[first] + chunk_size, side='right')) - 1
+            end = min(max(end, min_end), len(sentences))
             
-            # If adding this sentence would exceed chunk size, save current chunk
-            if current_length + sentence_length > chunk_size and current_chunk:
-                chunk_text = " ".join(current_chunk)
-                chunks.append({
-                    "text": chunk_text,
-                    "index": len(chunks),
-                    "document_id": document_id,
-                    "char_start": text.find(chunk_text) if chunk_text in text else 0,
-                    "char_end": 0  # Will be calculated if needed
-                })
-                
-                # Start new chunk with overlap (keep last few sentences)
-                overlap_sentences = current_chunk[-2:] if len(current_chunk) >= 2 else current_chunk
-                current_chunk = overlap_sentences + [sentence]
-                current_length = sum(len(s.split()) for s in current_chunk)
-            else:
-                current_chunk.append(sentence)
-                current_length += sentence_length
-        
-        # Add remaining chunk
-        if current_chunk:
-            chunk_text = " ".join(current_chunk)
+            current_start = sentences[first][0]
+            current_end = sentences[end - 1][1]
             chunks.append({
-                "text": chunk_text,
+                "text": text[current_start:current_end],
                 "index": len(chunks),
                 "document_id": document_id,
-                "char_start": text.find(chunk_text) if chunk_text in text else 0,
-                "char_end": 0
+                "char_start": current_start,
+                "char_end": current_end
             })
+            if end == len(sentences):
+                break
+            
+            # Start new chunk with overlap (keep last few sentences) plus the sentence that didn't fit
+            first = max(first, end - 2)
+            min_end = end + 1
         
         return chunks
     
-    def _split_into_sentences(self, text: str) -> List[str]:
-        """Split text into sentences using simple heuristics"""
-        import re
+    def _split_into_sentences(self, text: str) -> List[Tuple[int, int]]:
+        """Split text into sentences, returned as (start, end) spans into text"""
+        # Only the ends of the text can carry whitespace: every separator below
+        # consumes the whole whitespace run, so inner sentences are never empty
+        begin = len(text) - len(text.lstrip())
+        end = len(text.rstrip())
+        if begin >= end:
+            return []
+        
         # Split by sentence endings, but preserve abbreviations
-        sentences = re.split(r'(?<=[.!?])\s+', text)
-        # Filter out empty sentences
-        return [s.strip() for s in sentences if s.strip()]
+        sentences = []
+        start = begin
+        for match in _SENT_SPLIT_RE.finditer(text):
+            if match.start() >= end:
+                break
+            sentences.append((start, match.start()))
+            start = match.end()
+        sentences.append((start, end))
+        return sentences
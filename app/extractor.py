@@ -6,18 +6,40 @@ Extracts structured shipment data from documents using LLM
 import os
 import json
 import re
+import threading
 import requests
-from typing import Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import blake3
+import tiktoken
 
 
 class StructuredExtractor:
     """Extracts structured shipment data from logistics documents"""
     
+    __slots__ = ('llm_api_key', 'llm_api_url', 'llm_model', 'required_fields', '_session', '_field_res', '_cache', '_cache_lock', '_encoding')
+    
+    # Number of recent extraction results kept, keyed by document content hash
+    CACHE_SIZE = 128
+    
+    # Token budget for the document text sent to the LLM
+    LLM_INPUT_TOKENS = 3000
+    
     def __init__(self):
         self.llm_api_key = os.getenv("OPENROUTER_API_KEY", "")
         self.llm_api_url = "https://openrouter.ai/api/v1/chat/completions"
         self.llm_model = "openai/gpt-3.5-turbo"
         
+        # Persistent session so LLM calls reuse pooled keep-alive connections
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=20,
+            max_retries=Retry(total=2, backoff_factor=0.5)
+        ))
+        
         # Required fields for extraction
         self.required_fields = [
             "shipment_id",
@@ -33,6 +55,26 @@ class StructuredExtractor:
             "weight",
             "carrier_name"
         ]
+        
+        # Precompile rule-based patterns: per field, a union of all alternatives
+        # (cheap single-pass line filter) plus the ordered individual patterns
+        self._field_res: Dict[str, Tuple[re.Pattern, List[re.Pattern]]] = {}
+        for field, patterns in self.FIELD_PATTERNS.items():
+            union = "|".join(f"(?P<p{i}>{pattern})" for i, pattern in enumerate(patterns))
+            self._field_res[field] = (
+                re.compile(union, re.IGNORECASE),
+                [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+            )
+        
+        # LRU cache of extraction results so re-uploads and retries skip extraction
+        self._cache: "OrderedDict[bytes, Dict]" = OrderedDict()
+        self._cache_lock = threading.Lock()  # extract() may run on worker threads
+        
+        # Tokenizer for LLM input truncation, resolved once in the background: tiktoken
+        # downloads its data on first use without a timeout, so extraction never waits on it.
+        # None while loading, False if unavailable (character budget is used meanwhile).
+        self._encoding = None
+        threading.Thread(target=self._load_encoding, daemon=True).start()
     
     def extract(self, document_text: str) -> Dict:
         """
@@ -41,18 +83,36 @@ class StructuredExtractor:
         Returns:
             Dict with all required fields (null if not found)
         """
+        key = blake3.blake3(document_text.encode('utf-8', 'surrogatepass')).digest()
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return dict(cached)
+        
+        extracted = None
         # Try LLM-based extraction first
         if self.llm_api_key:
             try:
-                return self._extract_with_llm(document_text)
+                extracted = self._extract_with_llm(document_text)
             except Exception as e:
                 print(f"LLM extraction failed: {e}, falling back to rule-based")
         
-        # Fallback to rule-based extraction
-        return self._extract_with_rules(document_text)
+        # Fallback to rule-based extraction; when it stands in for a failed LLM call,
+        # leave it uncached so the next request retries the LLM
+        if extracted is None:
+            extracted = self._extract_with_rules(document_text)
+            if self.llm_api_key:
+                return dict(extracted)
+        
+        with self._cache_lock:
+            self._cache[key] = extracted
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return dict(extracted)
     
-    def _extract_with_llm(self, document_text: str) -> Dict:
-        """Extract using LLM"""
+    def _extract_with_llm(self, document_text: str) -> Optional[Dict]:
+        """Extract using LLM; None if the response holds no valid JSON"""
         prompt = f"""Extract the following shipment information from this logistics document.
 Return ONLY a valid JSON object with these exact fields. Use null for any missing values.
 
@@ -71,7 +131,7 @@ Required fields:
 - carrier_name
 
 Document text:
-{document_text[:4000]}
+{self._truncate_for_llm(document_text)}
 
 Return only the JSON object, no other text:"""
         
@@ -89,36 +149,175 @@ Return only the JSON object, no other text:"""
             "max_tokens": 500
         }
         
-        response = requests.post(self.llm_api_url, json=payload, headers=headers, timeout=30)
+        response = self._session.post(self.llm_api_url, json=payload, headers=headers, timeout=30)
         response.raise_for_status()
         
         result = response.json()
         llm_output = result["choices"][0]["message"]["content"].strip()
         
         # Extract JSON from response
-        try:
-            # Try to find JSON object in response
-            json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', llm_output, re.DOTALL)
-            if json_match:
-                extracted = json.loads(json_match.group())
-            else:
-                # Try parsing entire response as JSON
-                extracted = json.loads(llm_output)
-        except json.JSONDecodeError:
-            # If JSON parsing fails, fall back to rule-based extraction
+        extracted = self._parse_llm_json(llm_output)
+        if extracted is None:
+            # If JSON parsing fails, extract() falls back to rule-based extraction
             print("LLM returned invalid JSON, falling back to rule-based extraction")
-            return self._extract_with_rules(document_text)
+            return None
         
         # Ensure all fields are present
         return self._normalize_extraction(extracted)
     
+    def _parse_llm_json(self, llm_output: str) -> Optional[Dict]:
+        """Parse the JSON object in an LLM response using linear scans (no regex backtracking)"""
+        text = llm_output.strip()
+        # Unwrap a markdown code fence (```json ... ```)
+        if text.startswith("```"):
+            text = text[3:]
+            if text[:4].lower() == "json":
+                text = text[4:]
+            if text.endswith("```"):
+                text = text[:-3]
+            text = text.strip()
+        
+        try:
+            # Try parsing entire response as JSON
+            extracted = json.loads(text)
+        except json.JSONDecodeError:
+            # Otherwise decode the object starting at the first brace, ignoring trailing text,
+            # and as a last resort the span between the first and last brace
+            start = text.find("{")
+            end = text.rfind("}")
+            if start == -1 or end < start:
+                return None
+            try:
+                extracted, _ = json.JSONDecoder().raw_decode(text, start)
+            except json.JSONDecodeError:
+                try:
+                    extracted = json.loads(text[start:end + 1])
+                except json.JSONDecodeError:
+                    return None
+        
+        return extracted if isinstance(extracted, dict) else None
+    
+    def _load_encoding(self):
+        """Resolve the tokenizer for llm_model; failures are remembered, not retried"""
+        try:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.llm_model.split("/")[-1])
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"Tokenizer unavailable: {e}, truncating by characters")
+            self._encoding = False
+    
+    def _truncate_for_llm(self, document_text: str) -> str:
+        """Return the leading part of the document that fits in LLM_INPUT_TOKENS tokens"""
+        encoding = self._encoding
+        if not encoding:
+            # Tokenizer still loading or unavailable; fall back to a character budget
+            return document_text[:4000]
+        
+        # Encode line by line so only the leading part of a large document is tokenized
+        tokens = []
+        start = 0
+        while start < len(document_text) and len(tokens) < self.LLM_INPUT_TOKENS:
+            end = document_text.find("\n", start) + 1 or len(document_text)
+            tokens.extend(encoding.encode(document_text[start:end], disallowed_special=()))
+            start = end
+        return encoding.decode(tokens[:self.LLM_INPUT_TOKENS])
+    
     # Words/phrases that indicate garbage extraction (sentence fragments, section headers, etc.)
     BLOCKLIST = frozenset([
         "details", "name", "info", "information", "contact", "phone", "amount", "agreed",
         "location", "during", "follow", "driver", "procedures", "cedures", "operating", "hours",
         "normal", "standard", "receiving", "demo", "powered", "tms", "page", "email", "from the",
-        "follow on", "on-", "the shipper", "the consignee", "agreed amount", "—", "-"
+        "follow on", "on-", "the shipper", "the consignee", "carrier instructions", "agreed amount", "—", "-"
     ])
+    # Bare party labels (e.g. a "Shipper Consignee" header captured as a value); rejected only
+    # when the value is nothing but labels, so names like "Acme Shipper Co" stay valid
+    LABEL_ONLY = frozenset(["shipper", "consignee"])
+    # Blocklist entries longer than 3 chars also reject values that merely contain them
+    _BLOCKLIST_RE = re.compile("|".join(re.escape(bad) for bad in sorted(BLOCKLIST) if len(bad) > 3))
+
+    # Date value: explicit numeric date formats with optional time
+    DATE_VALUE = r'(\d{1,2}[\-/]\d{1,2}[\-/]\d{2,4}(?:\s+\d{1,2}:\d{2})?(?:\s*[ap]m)?|\d{4}[\-/]\d{2}[\-/]\d{2})'
+
+    # Label-aware, single-line patterns per field, in priority order.
+    # Patterns only ever see one line, and free-text captures are length-bounded
+    # so a missing terminator cannot send a lazy group across a long line.
+    FIELD_PATTERNS = {
+        "shipment_id": [
+            r'\b(?:load|reference|ref)[\s_]*(?:id|#|number)?[\s:]+([A-Za-z0-9\-]{4,30})\b',
+            r'\b(?:shipment|bol)[_\s]*(?:id|#|number)?[\s:]+([A-Za-z0-9\-]{4,30})\b',
+            r'\bpro[\s_]*(?:id|#|number)[\s:]+([A-Za-z0-9\-]{4,30})\b',
+            r'\b(?:bill\s+of\s+lading|bol)[\s#:]+([A-Za-z0-9\-]{4,30})\b',
+        ],
+        "shipper": [
+            r'shipper(?:\s+name)?[\s:]+([A-Za-z0-9\s&,.\-]{2,60}?)(?=consignee|carrier|phone|address|$)',
+            r'^\s*from[\s:]+([A-Za-z0-9\s&,.\-]{2,50}?)(?=to\s|consignee|$)',
+        ],
+        "consignee": [
+            r'consignee(?:\s+name)?[\s:]+([A-Za-z0-9\s&,.\-]{2,60}?)(?=carrier|shipper|phone|address|$)',
+            r'(?:deliver\s+to|^\s*to)[\s:]+([A-Za-z0-9\s&,.\-]{2,50}?)(?=from\s|carrier|$)',
+        ],
+        "pickup_datetime": [
+            r'(?:pickup|ship)(?:\s*(?:date|time|datetime))?[\s:]+' + DATE_VALUE,
+            r'shipping\s+date[\s:]+' + DATE_VALUE,
+            r'pickup[\s:]+([A-Za-z0-9\s,:\-]{3,40})',
+        ],
+        "delivery_datetime": [
+            r'delivery(?:\s*(?:date|time|datetime))?[\s:]+' + DATE_VALUE,
+            r'delivery\s+date[\s:]+' + DATE_VALUE,
+            r'delivery\s+time[\s:]+([A-Za-z0-9\s,:\-]{3,50})',
+        ],
+        "booking_datetime": [
+            r'booking(?:\s*(?:date|time|datetime))?[\s:]+' + DATE_VALUE,
+            r'booking[\s:]+(?:on\s+)?' + DATE_VALUE,
+            r'(?:booked|created)[\s:]+' + DATE_VALUE,
+            r'\bon\s+(\d{1,2}[\-/]\d{1,2}[\-/]\d{2,4}(?:\s+\d{1,2}:\d{2})?(?:\s*[ap]m)?)',
+        ],
+        "equipment_type": [
+            r'equipment(?:\s+type)?[\s:]+([A-Za-z0-9\s\-]{2,25})',
+            r'trailer\s+type[\s:]+([A-Za-z0-9\s\-]{2,25})',
+            r'(flatbed|dry\s+van|reefer|step\s+deck|lowboy)[\s:]*\$',
+        ],
+        "mode": [
+            r'\bmode[\s:]+([A-Za-z]{2,20})\b',
+            r'shipment\s+mode[\s:]+([A-Za-z]{2,20})',
+            r'load\s+type[\s\n]+([A-Z]{2,3})\b',
+        ],
+        "rate": [
+            r'(?:rate|amount)[\s:]*\$?\s*([0-9,]+\.?[0-9]*)',
+            r'\$\s*([0-9,]+\.?[0-9]+)',
+        ],
+        "currency": [
+            r'currency[\s:]+([A-Z]{3})\b',
+            r'\b(usd|eur|gbp)\b',
+        ],
+        "weight": [
+            r'weight[\s:]+([0-9,]+\.?[0-9]*)[\s]*(?:lbs?|kg|pounds?)?',
+            r'([0-9,]+\.?[0-9]+)\s*lbs?\b',
+            r'([0-9,]+\.?[0-9]*)\s*(?:lbs?|pounds?)\s*(?:weight|$)',
+        ],
+        "carrier_name": [
+            r'carrier(?:\s+name)?[\s:]+([A-Za-z0-9\s&,.\-]{2,50}?)(?=mc\s|phone|equipment|rate|details|$)',
+            r'carrier[\s:]+([A-Za-z0-9\s\&,\.\-]{2,50})',
+        ],
+    }
+
+    # Document-wide fallbacks for labels whose value sits on a following line.
+    # Only searched when the line-bound patterns for that field find nothing.
+    _FALLBACK_RES = {
+        "load_id": re.compile(r'Load[\s\n]+ID[\s\n]+([A-Z0-9\-]{4,30})', re.IGNORECASE),
+        "shipper_numbered": re.compile(r'Shipper.*?(\d+\.)[\s\n]+([A-Z][A-Za-z]+)', re.IGNORECASE | re.DOTALL),
+        "numbered": re.compile(r'(\d+\.)[\s\n]+([a-z][a-z]+)', re.IGNORECASE),
+        "pickup": re.compile(r'Pickup[\s\n]+([A-Z][A-Za-z0-9\s\&,\.\-]+?)(?=\n)', re.IGNORECASE),
+        "drop": re.compile(r'Drop[\s\n]+([a-z][a-z0-9\s\&,\.\-]+?)(?=\n)', re.IGNORECASE),
+        "ship_date": re.compile(r'Ship[\s\n]+Date[\s\n]+(\d{1,2}[\-/]\d{1,2}[\-/]\d{2,4})', re.IGNORECASE),
+        "delivery_date": re.compile(r'delivery\s+date[\s:\n]+(\d{1,2}[\-/]\d{1,2}[\-/]\d{2,4})', re.IGNORECASE),
+        "load_type": re.compile(r'Load Type[\s]*\n+([A-Z]{2,3})', re.IGNORECASE),
+        "weight": re.compile(r'(\d+)[\s\n]+lbs', re.IGNORECASE),
+        "accepted_by": re.compile(r'Accepted by[\s\n]+([A-Z][A-Za-z]+?)(?=\s+Date|\s+Signature|\n)', re.IGNORECASE),
+        "customer": re.compile(r'Customer[\s]+([A-Z][A-Za-z\s]+?)(?=\s+Contact|\n)', re.IGNORECASE),
+    }
 
     def _clean_value(self, s: Optional[str], max_len: int = 80) -> Optional[str]:
         """Trim and limit length; return None if looks like garbage."""
@@ -136,11 +335,10 @@ Return only the JSON object, no other text:"""
         if not value or len(value) < 2:
             return True
         v_lower = value.lower().strip()
-        if v_lower in self.BLOCKLIST:
+        if v_lower in self.BLOCKLIST or self.LABEL_ONLY.issuperset(v_lower.split()):
+            return True
+        if len(v_lower) < 50 and self._BLOCKLIST_RE.search(v_lower):
             return True
-        for bad in self.BLOCKLIST:
-            if len(bad) > 3 and bad in v_lower and len(v_lower) < 50:
-                return True
         if field in ("shipper", "consignee", "carrier_name"):
             if any(x in v_lower for x in (" during ", " to follow", " location ", " procedures", " driver ", " operating ")):
                 return True
@@ -162,22 +360,18 @@ Return only the JSON object, no other text:"""
                 return True
         return False
 
-    def _extract_on_line(self, text: str, patterns: list, max_len: int = 80, reject_field: Optional[str] = None) -> Optional[str]:
-        """Try each pattern; only capture on the same line; value from original text."""
-        lines = text.split("\n")
+    def _extract_on_line(self, lines: List[str], field: str, max_len: int = 80, reject_field: Optional[str] = None) -> Optional[str]:
+        """Try each of the field's patterns in order; only capture on the same line."""
+        union, patterns = self._field_res[field]
         for line in lines:
-            line_lower = line.lower()
+            # Single scan rejects lines no alternative can match
+            if not union.search(line):
+                continue
             for pattern in patterns:
-                match = re.search(pattern, line_lower, re.IGNORECASE)
+                match = pattern.search(line)
                 if match:
-                    try:
-                        if match.lastindex and match.lastindex >= 1:
-                            result = line[match.start(1):match.end(1)].strip()
-                        else:
-                            result = line[match.start(0):match.end(0)].strip()
-                    except (IndexError, AttributeError):
-                        result = (match.group(1) if match.lastindex else match.group(0)).strip()
-                    result = self._clean_value(result, max_len)
+                    result = (match.group(1) if match.lastindex else match.group(0)) or ""
+                    result = self._clean_value(result.strip(), max_len)
                     if result and (reject_field is None or not self._reject_garbage(result, reject_field)):
                         return result
         return None
@@ -185,16 +379,11 @@ Return only the JSON object, no other text:"""
     def _extract_with_rules(self, document_text: str) -> Dict:
         """Rule-based extraction: label-aware, line-bound, length-limited."""
         text_lower = document_text.lower()
+        lines = document_text.split("\n")
         extracted = {}
 
         # Shipment ID: Load ID, Reference ID, BOL, etc.
-        shipment_id_patterns = [
-            r'\b(?:load|reference|ref)[\s_]*(?:id|#|number)?[\s:]+([A-Za-z0-9\-]{4,30})\b',
-            r'\b(?:shipment|bol)[_\s]*(?:id|#|number)?[\s:]+([A-Za-z0-9\-]{4,30})\b',
-            r'\bpro[\s_]*(?:id|#|number)[\s:]+([A-Za-z0-9\-]{4,30})\b',
-            r'\b(?:bill\s+of\s+lading|bol)[\s#:]+([A-Za-z0-9\-]{4,30})\b',
-        ]
-        extracted["shipment_id"] = self._extract_on_line(document_text, shipment_id_patterns, 40)
+        extracted["shipment_id"] = self._extract_on_line(lines, "shipment_id", 40)
         if extracted["shipment_id"]:
             if not re.match(r'^[A-Za-z0-9\-]+$', extracted["shipment_id"]):
                 extracted["shipment_id"] = None
@@ -202,186 +391,110 @@ Return only the JSON object, no other text:"""
                 extracted["shipment_id"] = None
         # Fallback: Load ID on separate lines
         if not extracted["shipment_id"]:
-            load_match = re.search(r'Load[\s\n]+ID[\s\n]+([A-Z0-9\-]{4,30})', document_text, re.IGNORECASE)
+            load_match = self._FALLBACK_RES["load_id"].search(document_text)
             if load_match:
                 extracted["shipment_id"] = load_match.group(1)
 
         # Shipper: same line only; reject sentence fragments
-        shipper_patterns = [
-            r'shipper(?:\s+name)?[\s:]+([A-Za-z0-9\s\&,\.\-]+?)(?=\n|consignee|carrier|phone|address|$)',
-            r'^\s*from[\s:]+([A-Za-z0-9\s\&,\.\-]{2,50}?)(?=\n|to\s|consignee|$)',
-        ]
-        extracted["shipper"] = self._extract_on_line(document_text, shipper_patterns, 60, "shipper")
+        extracted["shipper"] = self._extract_on_line(lines, "shipper", 60, "shipper")
         # Fallback: extract from Pickup section or after Shipper label
         if not extracted["shipper"]:
             # Try BOL format: "Shipper...1. AAA"
-            shipper_match = re.search(r'Shipper.*?(\d+\.)[\s\n]+([A-Z][A-Za-z]+)', document_text, re.IGNORECASE | re.DOTALL)
+            shipper_match = self._FALLBACK_RES["shipper_numbered"].search(document_text)
             if shipper_match:
                 result = self._clean_value(shipper_match.group(2), 60)
                 if result and not self._reject_garbage(result, "shipper"):
                     extracted["shipper"] = result
             # Try Pickup section format
             if not extracted["shipper"]:
-                pickup_match = re.search(r'Pickup[\s\n]+([A-Z][A-Za-z0-9\s\&,\.\-]+?)(?=\n)', document_text, re.IGNORECASE)
-                if pickup_match:
-                    result = self._clean_value(pickup_match.group(1), 60)
-                    if result and not self._reject_garbage(result, "shipper"):
-                        extracted["shipper"] = result
-
-            # Try Pickup section format
-            if not extracted["shipper"]:
-                pickup_match = re.search(r'Pickup[\s\n]+([A-Z][A-Za-z0-9\s\&,\.\-]+?)(?=\n)', document_text, re.IGNORECASE)
-                if pickup_match:
-                    result = self._clean_value(pickup_match.group(1), 60)
-                    if result and not self._reject_garbage(result, "shipper"):
-                        extracted["shipper"] = result
-
-            # Try Pickup section format
-            elif not extracted["shipper"]:
-                pickup_match = re.search(r'Pickup[\s\n]+([A-Z][A-Za-z0-9\s\&,\.\-]+?)(?=\n)', document_text, re.IGNORECASE)
+                pickup_match = self._FALLBACK_RES["pickup"].search(document_text)
                 if pickup_match:
                     result = self._clean_value(pickup_match.group(1), 60)
                     if result and not self._reject_garbage(result, "shipper"):
                         extracted["shipper"] = result
 
         # Consignee: same line only; reject sentence fragments
-        consignee_patterns = [
-            r'consignee(?:\s+name)?[\s:]+([A-Za-z0-9\s\&,\.\-]+?)(?=\n|carrier|shipper|phone|address|$)',
-            r'(?:deliver\s+to|^\s*to)[\s:]+([A-Za-z0-9\s\&,\.\-]{2,50}?)(?=\n|from\s|carrier|$)',
-        ]
-        extracted["consignee"] = self._extract_on_line(document_text, consignee_patterns, 60, "consignee")
+        extracted["consignee"] = self._extract_on_line(lines, "consignee", 60, "consignee")
         # Fallback: extract from Drop section or after Consignee label
         if not extracted["consignee"]:
             # Try BOL format: find second "1." for consignee (first is for shipper)
-            matches = list(re.finditer(r'(\d+\.)[\s\n]+([a-z][a-z]+)', document_text, re.IGNORECASE))
-            if len(matches) >= 2:
-                result = self._clean_value(matches[1].group(2), 60)
+            matches = self._FALLBACK_RES["numbered"].finditer(document_text)
+            second = next(matches, None) and next(matches, None)
+            if second:
+                result = self._clean_value(second.group(2), 60)
                 if result and not self._reject_garbage(result, "consignee"):
                     extracted["consignee"] = result
             # Try Drop section format
             if not extracted["consignee"]:
-                drop_match = re.search(r'Drop[\s\n]+([a-z][a-z0-9\s\&,\.\-]+?)(?=\n)', document_text, re.IGNORECASE)
-                if drop_match:
-                    result = self._clean_value(drop_match.group(1), 60)
-                    if result and not self._reject_garbage(result, "consignee"):
-                        extracted["consignee"] = result
-
-
-            # Try Drop section format
-            elif not extracted["consignee"]:
-                drop_match = re.search(r'Drop[\s\n]+([a-z][a-z0-9\s\&,\.\-]+?)(?=\n)', document_text, re.IGNORECASE)
+                drop_match = self._FALLBACK_RES["drop"].search(document_text)
                 if drop_match:
                     result = self._clean_value(drop_match.group(1), 60)
                     if result and not self._reject_garbage(result, "consignee"):
                         extracted["consignee"] = result
 
         # Dates: prefer explicit date formats
-        date_value = r'(\d{1,2}[\-/]\d{1,2}[\-/]\d{2,4}(?:\s+\d{1,2}:\d{2})?(?:\s*[ap]m)?|\d{4}[\-/]\d{2}[\-/]\d{2})'
-        pickup_patterns = [
-            r'(?:pickup|ship)(?:\s*(?:date|time|datetime))?[\s:]+' + date_value,
-            r'shipping\s+date[\s:]+' + date_value,
-            r'pickup[\s:]+([A-Za-z0-9\s,:\-]{3,40})',
-        ]
-        extracted["pickup_datetime"] = self._extract_on_line(document_text, pickup_patterns, 50, "pickup_datetime")
+        extracted["pickup_datetime"] = self._extract_on_line(lines, "pickup_datetime", 50, "pickup_datetime")
         # Fallback: Ship Date on separate lines
         if not extracted["pickup_datetime"]:
-            ship_match = re.search(r'Ship[\s\n]+Date[\s\n]+(\d{1,2}[\-/]\d{1,2}[\-/]\d{2,4})', document_text, re.IGNORECASE)
+            ship_match = self._FALLBACK_RES["ship_date"].search(document_text)
             if ship_match:
                 extracted["pickup_datetime"] = ship_match.group(1)
 
-        delivery_patterns = [
-            r'delivery(?:\s*(?:date|time|datetime))?[\s:]+' + date_value,
-            r'delivery\s+date[\s:]+' + date_value,
-            r'delivery\s+time[\s:]+([A-Za-z0-9\s,:\-]{3,50})',
-        ]
-        extracted["delivery_datetime"] = self._extract_on_line(document_text, delivery_patterns, 50, "delivery_datetime")
+        extracted["delivery_datetime"] = self._extract_on_line(lines, "delivery_datetime", 50, "delivery_datetime")
         # Fallback: extract from full text if not found on same line
         if not extracted["delivery_datetime"]:
-            delivery_match = re.search(r'delivery\s+date[\s:\n]+(\d{1,2}[\-/]\d{1,2}[\-/]\d{2,4})', document_text, re.IGNORECASE)
+            delivery_match = self._FALLBACK_RES["delivery_date"].search(document_text)
             if delivery_match:
                 extracted["delivery_datetime"] = delivery_match.group(1)
 
-        booking_patterns = [
-            r'booking(?:\s*(?:date|time|datetime))?[\s:]+' + date_value,
-            r'booking[\s:]+(?:on\s+)?' + date_value,
-            r'(?:booked|created)[\s:]+' + date_value,
-            r'\bon\s+(\d{1,2}[\-/]\d{1,2}[\-/]\d{2,4}(?:\s+\d{1,2}:\d{2})?(?:\s*[ap]m)?)',
-        ]
-        raw_booking = self._extract_on_line(document_text, booking_patterns, 50, "booking_datetime")
+        raw_booking = self._extract_on_line(lines, "booking_datetime", 50, "booking_datetime")
         if raw_booking:
             raw_booking = re.sub(r'^\s*on\s+', '', raw_booking, flags=re.IGNORECASE).strip()
         extracted["booking_datetime"] = raw_booking
 
         # Equipment: single line; reject "Agreed Amount" etc.
-        equipment_patterns = [
-            r'equipment(?:\s+type)?[\s:]+([A-Za-z0-9\s\-]{2,25})',
-            r'trailer\s+type[\s:]+([A-Za-z0-9\s\-]{2,25})',
-            r'(flatbed|dry\s+van|reefer|step\s+deck|lowboy)[\s:]*\$',
-        ]
-        extracted["equipment_type"] = self._extract_on_line(document_text, equipment_patterns, 25, "equipment_type")
+        extracted["equipment_type"] = self._extract_on_line(lines, "equipment_type", 25, "equipment_type")
 
         # Mode: single word or two (e.g. LTL, FTL, Truckload)
-        mode_patterns = [
-            r'\bmode[\s:]+([A-Za-z]{2,20})\b',
-            r'shipment\s+mode[\s:]+([A-Za-z]{2,20})',
-            r'load\s+type[\s\n]+([A-Z]{2,3})\b',
-        ]
-        extracted["mode"] = self._extract_on_line(document_text, mode_patterns, 20)
+        extracted["mode"] = self._extract_on_line(lines, "mode", 20)
         # Fallback: extract FTL/LTL from Load Type section
         if not extracted["mode"]:
-            mode_match = re.search(r'Load Type[\s]*\n+([A-Z]{2,3})', document_text, re.IGNORECASE)
+            mode_match = self._FALLBACK_RES["load_type"].search(document_text)
             if mode_match:
                 extracted["mode"] = mode_match.group(1)
 
         # Rate: number only (with optional $ and commas)
-        rate_patterns = [
-            r'(?:rate|amount)[\s:]*\$?\s*([0-9,]+\.?[0-9]*)',
-            r'\$\s*([0-9,]+\.?[0-9]+)',
-        ]
-        rate_str = self._extract_on_line(document_text, rate_patterns, 15)
+        rate_str = self._extract_on_line(lines, "rate", 15)
         if rate_str:
             rate_str = rate_str.replace(",", "").replace("$", "").strip()
         extracted["rate"] = float(rate_str) if rate_str and re.match(r'^[0-9.]+$', rate_str) else None
 
         # Currency
-        currency_patterns = [
-            r'currency[\s:]+([A-Z]{3})\b',
-            r'\b(usd|eur|gbp)\b',
-        ]
-        currency = self._extract_on_line(document_text, currency_patterns, 5) or self._extract_pattern(text_lower, [r'\b(usd|eur|gbp)\b'])
+        currency = self._extract_on_line(lines, "currency", 5) or self._extract_pattern(text_lower, [r'\b(usd|eur|gbp)\b'])
         extracted["currency"] = (currency or "USD").upper() if currency else "USD"
 
         # Weight: number + optional unit
-        weight_patterns = [
-            r'weight[\s:]+([0-9,]+\.?[0-9]*)[\s]*(?:lbs?|kg|pounds?)?',
-            r'([0-9,]+\.?[0-9]+)\s*lbs?\b',
-            r'([0-9,]+\.?[0-9]*)\s*(?:lbs?|pounds?)\s*(?:weight|$)',
-        ]
-        weight_str = self._extract_on_line(document_text, weight_patterns, 20)
+        weight_str = self._extract_on_line(lines, "weight", 20)
         if weight_str:
             weight_str = re.sub(r'[^\d.]', '', weight_str.replace(",", ""))
         extracted["weight"] = float(weight_str) if weight_str and re.match(r'^[0-9.]+$', weight_str) else None
         # Fallback: weight on separate line
         if not extracted["weight"]:
-            weight_match = re.search(r'(\d+)[\s\n]+lbs', document_text, re.IGNORECASE)
+            weight_match = self._FALLBACK_RES["weight"].search(document_text)
             if weight_match:
                 extracted["weight"] = float(weight_match.group(1))
 
         # Carrier name: same line, bounded; reject "Details", "Name", etc.
-        carrier_patterns = [
-            r'carrier(?:\s+name)?[\s:]+([A-Za-z0-9\s\&,\.\-]+?)(?=\n|mc\s|phone|equipment|rate|details|$)',
-            r'carrier[\s:]+([A-Za-z0-9\s\&,\.\-]{2,50})',
-        ]
-        extracted["carrier_name"] = self._extract_on_line(document_text, carrier_patterns, 50, "carrier_name")
+        extracted["carrier_name"] = self._extract_on_line(lines, "carrier_name", 50, "carrier_name")
         # Fallback: extract from Accepted by section or Customer name
         if not extracted["carrier_name"]:
-            carrier_match = re.search(r'Accepted by[\s\n]+([A-Z][A-Za-z]+?)(?=\s+Date|\s+Signature|\n)', document_text, re.IGNORECASE)
+            carrier_match = self._FALLBACK_RES["accepted_by"].search(document_text)
             if carrier_match and carrier_match.group(1).lower() not in ('date', 'signature'):
                 result = self._clean_value(carrier_match.group(1), 50)
                 if result and not self._reject_garbage(result, "carrier_name"):
                     extracted["carrier_name"] = result
             if not extracted["carrier_name"]:
-                customer_match = re.search(r'Customer[\s]+([A-Z][A-Za-z\s]+?)(?=\s+Contact|\n)', document_text, re.IGNORECASE)
+                customer_match = self._FALLBACK_RES["customer"].search(document_text)
                 if customer_match:
                     result = self._clean_value(customer_match.group(1), 50)
                     if result and result.lower() not in ('details', 'contact'):
@@ -3,12 +3,44 @@ Guardrails Module
 Implements safety checks to prevent hallucinations and ensure grounded answers
 """
 
-from typing import List, Dict
+import re
+from types import MappingProxyType
+from typing import List, Dict, Mapping
 
 
 class Guardrails:
     """Guardrails to prevent hallucinations and ensure answer quality"""
     
+    __slots__ = ('min_similarity_threshold', 'min_chunks_required')
+    
+    # Phrases that indicate missing information, compiled into a single alternation
+    _MISSING_RE = re.compile(
+        r'cannot find|not in the document|not available|not found|not mentioned',
+        re.IGNORECASE
+    )
+    
+    # Fixed check() results, shared read-only so hot rejection paths don't allocate
+    EMPTY_RESULT = MappingProxyType({
+        "allowed": False,
+        "message": "I cannot find relevant information in the document to answer this question.",
+        "reason": "no_relevant_chunks"
+    })
+    INSUFFICIENT_RESULT = MappingProxyType({
+        "allowed": False,
+        "message": "Insufficient context found in the document to provide a reliable answer.",
+        "reason": "insufficient_chunks"
+    })
+    TOO_SHORT_RESULT = MappingProxyType({
+        "allowed": False,
+        "message": "The retrieved document sections are too short to provide a meaningful answer.",
+        "reason": "chunks_too_short"
+    })
+    PASSED_RESULT = MappingProxyType({
+        "allowed": True,
+        "message": "",
+        "reason": "passed"
+    })
+    
     def __init__(self):
         self.min_similarity_threshold = 0.3  # Minimum similarity score to allow answer
         self.min_chunks_required = 1  # Minimum number of relevant chunks
@@ -18,20 +50,16 @@ class Guardrails:
         question: str,
         chunks: List[Dict],
         similarity_scores: List[float]
-    ) -> Dict:
+    ) -> Mapping:
         """
         Check if answer should be allowed based on guardrails
         
         Returns:
-            Dict with 'allowed', 'message', and 'reason' keys
+            Read-only mapping with 'allowed', 'message', and 'reason' keys
         """
         # Guardrail 1: Check if we have any relevant chunks
-        if not chunks or len(chunks) == 0:
-            return {
-                "allowed": False,
-                "message": "I cannot find relevant information in the document to answer this question.",
-                "reason": "no_relevant_chunks"
-            }
+        if not chunks:
+            return self.EMPTY_RESULT
         
         # Guardrail 2: Check similarity threshold
         if similarity_scores:
@@ -46,27 +74,15 @@ class Guardrails:
         
         # Guardrail 3: Check if we have minimum required chunks
         if len(chunks) < self.min_chunks_required:
-            return {
-                "allowed": False,
-                "message": "Insufficient context found in the document to provide a reliable answer.",
-                "reason": "insufficient_chunks"
-            }
+            return self.INSUFFICIENT_RESULT
         
         # Guardrail 4: Check if chunks are too short (likely noise)
         valid_chunks = [chunk for chunk in chunks if len(chunk.get("text", "").split()) >= 5]
         if len(valid_chunks) < self.min_chunks_required:
-            return {
-                "allowed": False,
-                "message": "The retrieved document sections are too short to provide a meaningful answer.",
-                "reason": "chunks_too_short"
-            }
+            return self.TOO_SHORT_RESULT
         
         # All guardrails passed
-        return {
-            "allowed": True,
-            "message": "",
-            "reason": "passed"
-        }
+        return self.PASSED_RESULT
     
     def validate_answer_grounding(
         self,
@@ -79,15 +95,7 @@ class Guardrails:
         answer_lower = answer.lower()
         
         # Check for phrases that indicate missing information
-        missing_phrases = [
-            "cannot find",
-            "not in the document",
-            "not available",
-            "not found",
-            "not mentioned"
-        ]
-        
-        if any(phrase in answer_lower for phrase in missing_phrases):
+        if self._MISSING_RE.search(answer):
             return {
                 "grounded": False,
                 "reason": "answer_indicates_missing_info"
@@ -96,11 +104,15 @@ class Guardrails:
         # Check if answer contains words from context (simple grounding check)
         context_words = set()
         for chunk in context_chunks:
-            words = chunk.get("text", "").lower().split()
-            context_words.update(words[:50])  # Top 50 words from context
+            # Cache each chunk's word set so repeated checks against the same context skip re-tokenizing
+            words = chunk.get("_word_set")
+            if words is None:
+                words = frozenset(chunk.get("text", "").lower().split()[:50])  # Top 50 words from context
+                chunk["_word_set"] = words
+            context_words.update(words)
         
         answer_words = set(answer_lower.split())
-        overlap = len(answer_words.intersection(context_words))
+        overlap = len(answer_words & context_words)
         overlap_ratio = overlap / max(len(answer_words), 1)
         
         if overlap_ratio < 0.1:  # Less than 10% word overlap
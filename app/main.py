@@ -3,11 +3,14 @@ Ultra Doc-Intelligence - Main FastAPI Application
 AI-powered logistics document intelligence system with RAG capabilities
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from pydantic import BaseModel
+from collections import OrderedDict
 from typing import Optional
+from uuid import uuid4
+import asyncio
 import uvicorn
 import os
 
@@ -16,6 +19,9 @@ from app.rag_system import RAGSystem
 from app.extractor import StructuredExtractor
 from app.guardrails import Guardrails
 
+# Upload size cap
+MAX_UPLOAD_BYTES = 50 << 20
+
 app = FastAPI(
     title="Ultra Doc-Intelligence",
     description="AI-powered logistics document intelligence system",
@@ -31,15 +37,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize components
-doc_processor = DocumentProcessor()
-rag_system = RAGSystem()
-extractor = StructuredExtractor()
-guardrails = Guardrails()
+# Components are built on startup, not at import: spawned worker processes
+# (large-PDF extraction) re-import the launching module and must stay light
+doc_processor: Optional[DocumentProcessor] = None
+rag_system: Optional[RAGSystem] = None
+extractor: Optional[StructuredExtractor] = None
+guardrails: Optional[Guardrails] = None
+
+
+class DocumentRegistry:
+    """Remembers the last uploaded document per browser session (cookie "sid")"""
+    
+    def __init__(self, max_sessions: int = 1024):
+        self.max_sessions = max_sessions
+        self._lock = asyncio.Lock()
+        self._last_by_session: "OrderedDict[str, str]" = OrderedDict()
+    
+    async def set_last(self, session: str, document_id: str):
+        async with self._lock:
+            self._last_by_session[session] = document_id
+            self._last_by_session.move_to_end(session)
+            if len(self._last_by_session) > self.max_sessions:
+                self._last_by_session.popitem(last=False)
+    
+    async def get_last(self, session: Optional[str]) -> Optional[str]:
+        if not session:
+            return None
+        async with self._lock:
+            return self._last_by_session.get(session)
 
-# Store current document context
-current_document_id = None
-current_document_text = None
+
+# Store current document context per session
+registry = DocumentRegistry()
 
 
 class QuestionRequest(BaseModel):
@@ -51,6 +80,22 @@ class ExtractRequest(BaseModel):
     document_id: Optional[str] = None
 
 
+@app.on_event("startup")
+async def startup():
+    """Initialize components"""
+    global doc_processor, rag_system, extractor, guardrails
+    doc_processor = DocumentProcessor()
+    rag_system = RAGSystem()
+    extractor = StructuredExtractor()
+    guardrails = Guardrails()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled LLM API connections"""
+    await rag_system.aclose()
+
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     """Serve the main UI"""
@@ -60,13 +105,11 @@ async def root():
 
 
 @app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
+async def upload_document(http_request: Request, response: Response, file: UploadFile = File(...)):
     """
     Upload and process a logistics document (PDF, DOCX, or TXT)
     Returns document_id for subsequent queries
     """
-    global current_document_id, current_document_text
-    
     try:
         # Validate file type
         allowed_extensions = ['.pdf', '.docx', '.txt']
@@ -78,21 +121,32 @@ async def upload_document(file: UploadFile = File(...)):
                 detail=f"Unsupported file type. Allowed: {', '.join(allowed_extensions)}"
             )
         
-        # Read file content
-        content = await file.read()
+        # The multipart parser has already spooled the upload; check its size and
+        # hand the spooled file to the processor without another copy
+        size = file.size
+        if size is None:
+            file.file.seek(0, os.SEEK_END)
+            size = file.file.tell()
+        if size > MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Maximum size is {MAX_UPLOAD_BYTES >> 20} MB"
+            )
         
-        # Process document
-        document_id, chunks, text = doc_processor.process_document(
-            content=content,
+        # Process document (parsing and encoding are CPU-bound; run them off the event loop)
+        document_id, chunks, text = await asyncio.to_thread(
+            doc_processor.process_document,
+            content=file.file,
             filename=file.filename,
             file_type=file_ext
         )
         
         # Create embeddings and store in vector index
-        rag_system.index_document(document_id, chunks, text)
+        await asyncio.to_thread(rag_system.index_document, document_id, chunks, text)
         
-        current_document_id = document_id
-        current_document_text = text
+        session = http_request.cookies.get("sid") or uuid4().hex
+        await registry.set_last(session, document_id)
+        response.set_cookie("sid", session, httponly=True, samesite="lax")
         
         return {
             "status": "success",
@@ -102,20 +156,20 @@ async def upload_document(file: UploadFile = File(...)):
             "message": "Document processed and indexed successfully"
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
 
 @app.post("/ask")
-async def ask_question(request: QuestionRequest):
+async def ask_question(request: QuestionRequest, http_request: Request):
     """
     Ask a question about the uploaded document using RAG
     Returns answer, source text, and confidence score
     """
-    global current_document_id
-    
     try:
-        document_id = request.document_id or current_document_id
+        document_id = request.document_id or await registry.get_last(http_request.cookies.get("sid"))
         
         if not document_id:
             raise HTTPException(
@@ -124,7 +178,8 @@ async def ask_question(request: QuestionRequest):
             )
         
         # Retrieve relevant context using RAG
-        relevant_chunks, similarity_scores = rag_system.retrieve(
+        relevant_chunks, similarity_scores = await asyncio.to_thread(
+            rag_system.retrieve,
             query=request.question,
             document_id=document_id,
             top_k=3
@@ -147,7 +202,7 @@ async def ask_question(request: QuestionRequest):
             }
         
         # Generate answer using LLM with retrieved context
-        answer, confidence = rag_system.generate_answer(
+        answer, confidence = await rag_system.generate_answer(
             question=request.question,
             context_chunks=relevant_chunks,
             similarity_scores=similarity_scores
@@ -175,15 +230,13 @@ async def ask_question(request: QuestionRequest):
 
 
 @app.post("/extract")
-async def extract_structured_data(request: ExtractRequest):
+async def extract_structured_data(request: ExtractRequest, http_request: Request):
     """
     Extract structured shipment data from the document
     Returns JSON with shipment fields or nulls if missing
     """
-    global current_document_id, current_document_text
-    
     try:
-        document_id = request.document_id or current_document_id
+        document_id = request.document_id or await registry.get_last(http_request.cookies.get("sid"))
         
         if not document_id:
             raise HTTPException(
@@ -191,18 +244,14 @@ async def extract_structured_data(request: ExtractRequest):
                 detail="No document uploaded. Please upload a document first."
             )
         
-        # Get document text (from vector store or in-memory fallback)
+        # Get document text (from vector store, reloaded from disk after a restart)
         try:
-            document_text = rag_system.get_document_text(document_id)
+            document_text = await asyncio.to_thread(rag_system.get_document_text, document_id)
         except ValueError:
-            # Document not in index (e.g. server restarted); try server-side fallback
-            if document_id == current_document_id and current_document_text:
-                document_text = current_document_text
-            else:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Document not found. Please upload the document again."
-                )
+            raise HTTPException(
+                status_code=400,
+                detail="Document not found. Please upload the document again."
+            )
         
         if not (document_text or document_text.strip()):
             raise HTTPException(
@@ -212,7 +261,7 @@ async def extract_structured_data(request: ExtractRequest):
         
         # Extract structured data using LLM or rule-based fallback
         try:
-            extracted_data = extractor.extract(document_text)
+            extracted_data = await asyncio.to_thread(extractor.extract, document_text)
         except Exception as e:
             raise HTTPException(
                 status_code=500,
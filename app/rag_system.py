@@ -4,28 +4,110 @@ Handles embeddings, vector search, and answer generation
 """
 
 import os
+import re
+import atexit
 import json
-from typing import List, Dict, Tuple
+import pickle
+import statistics
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
 import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
-import requests
+from sklearn.feature_extraction.text import CountVectorizer
+import httpx
+
+try:
+    import faiss
+except ImportError:  # Fall back to brute-force NumPy search
+    faiss = None
 
 
 class RAGSystem:
     """RAG system for document retrieval and answer generation"""
     
+    # Number of recent query embeddings kept, keyed by query text
+    QUERY_CACHE_SIZE = 1024
+    
+    # Documents with more chunks than this are encoded across worker processes (PyTorch on CPU)
+    MULTI_PROCESS_MIN_CHUNKS = 64
+    
+    # Phrases that indicate the answer is missing, compiled into a single alternation
+    _MISSING_RE = re.compile(r'cannot find|not in|not available|not found', re.IGNORECASE)
+    
+    # Document IDs are hex digests; anything else never maps to a cache file
+    _DOCUMENT_ID_RE = re.compile(r'[0-9a-f]{32}')
+    
     def __init__(self):
-        # Initialize embedding model
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.embedding_dim = 384
+        # Initialize embedding model (fp16 on GPU, quantized ONNX Runtime on CPU)
+        if torch.cuda.is_available():
+            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2', device="cuda")
+            self.embedding_model.half()
+            self.encode_workers = 0
+        else:
+            self.embedding_model = self._load_onnx_model()
+            # Worker processes only help the PyTorch fallback: ONNX Runtime sessions
+            # cannot be pickled to workers, and ORT already spreads a batch over all cores
+            cpu_count = os.cpu_count() or 1
+            uses_torch = getattr(self.embedding_model, "backend", "torch") == "torch"
+            self.encode_workers = min(4, cpu_count) if uses_torch and cpu_count >= 4 else 0
+        self.encode_batch_size = 64
+        
+        # Multi-process encode pool (PyTorch on CPU only), started on the first large document
+        self._encode_pool = None
+        self._encode_pool_lock = threading.Lock()
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()  # retrieve() runs on worker threads
+        self.embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
         
-        # In-memory vector store (can be replaced with FAISS, Pinecone, etc.)
+        # In-memory vector store: a FAISS index per document when available,
+        # persisted under cache_dir so documents survive restarts
         self.vector_store: Dict[str, Dict] = {}
+        self.cache_dir = "cache"
+        os.makedirs(self.cache_dir, exist_ok=True)
+        
+        # Approximate index for large documents; exact flat search below the threshold
+        self.index_factory = "HNSW32"
+        self.ann_min_vectors = 1000
+        self.hnsw_ef_search = 64
+        self.ivf_nprobe = 10
         
         # LLM API configuration (using OpenRouter as per resume experience)
         self.llm_api_key = os.getenv("OPENROUTER_API_KEY", "")
         self.llm_api_url = "https://openrouter.ai/api/v1/chat/completions"
         self.llm_model = "openai/gpt-3.5-turbo"  # Can be changed to other models
+        
+        # Pooled HTTP/2 client: keeps the TLS connection alive across questions
+        self._http = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=20)
+        )
+        
+        # Warm start: bring back documents indexed before the last restart
+        self._load_cached_documents()
+    
+    async def aclose(self):
+        """Close pooled HTTP connections"""
+        await self._http.aclose()
+    
+    def _load_onnx_model(self) -> SentenceTransformer:
+        """Load the int8-quantized ONNX export of the model, falling back to PyTorch"""
+        try:
+            return SentenceTransformer(
+                'all-MiniLM-L6-v2',
+                device="cpu",
+                backend="onnx",
+                model_kwargs={
+                    "file_name": "onnx/model_quint8_avx2.onnx",
+                    "provider": "CPUExecutionProvider"
+                }
+            )
+        except Exception as e:
+            print(f"ONNX backend unavailable: {e}, using PyTorch")
+            return SentenceTransformer('all-MiniLM-L6-v2', device="cpu")
     
     def index_document(self, document_id: str, chunks: List[Dict], full_text: str):
         """
@@ -36,15 +118,172 @@ class RAGSystem:
         
         # Generate embeddings for all chunks
         chunk_texts = [chunk["text"] for chunk in chunks]
-        embeddings = self.embedding_model.encode(chunk_texts, show_progress_bar=False)
         
-        # Store in vector index
-        self.vector_store[document_id] = {
-            "chunks": chunks,
-            "embeddings": embeddings.tolist(),
-            "full_text": full_text
+        # Pre-tokenize once for confidence scoring
+        for chunk in chunks:
+            chunk["_top_words"] = frozenset(chunk["text"].lower().split()[:10])
+        
+        # L2-normalized vectors make inner product equal to cosine similarity
+        pool = self._get_encode_pool() if len(chunk_texts) > self.MULTI_PROCESS_MIN_CHUNKS else None
+        if pool is not None:
+            embeddings = self.embedding_model.encode_multi_process(
+                chunk_texts,
+                pool,
+                batch_size=32,
+                normalize_embeddings=True
+            )
+        else:
+            embeddings = self.embedding_model.encode(
+                chunk_texts,
+                batch_size=self.encode_batch_size,
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+        embeddings = embeddings.astype(np.float32, copy=False)
+        
+        if faiss is not None:
+            index = self._build_index(embeddings)
+            
+            self.vector_store[document_id] = {
+                "chunks": chunks,
+                "index": index,
+                "full_text": full_text
+            }
+        else:
+            # Store in vector index as one contiguous float32 matrix
+            self.vector_store[document_id] = {
+                "chunks": chunks,
+                "embeddings": np.ascontiguousarray(embeddings),
+                "full_text": full_text
+            }
+        
+        # Sentence-term matrix for the keyword fallback in _simple_answer_extraction
+        self.vector_store[document_id].update(self._build_sentence_index(chunks))
+        
+        self._save_document(document_id)
+    
+    def _build_sentence_index(self, chunks: List[Dict]) -> Dict:
+        """Build a binary sentence-term matrix over all chunk sentences"""
+        sentences = []
+        offsets = [0]  # Chunk i owns sentence rows offsets[i]:offsets[i + 1]
+        for chunk in chunks:
+            sentences.extend(chunk["text"].split(". "))
+            offsets.append(len(sentences))
+        
+        vectorizer = CountVectorizer(binary=True, token_pattern=r"\w+")
+        try:
+            matrix = vectorizer.fit_transform(sentences).tocsr()
+        except ValueError:  # No word tokens anywhere in the document
+            vectorizer = matrix = None
+        
+        return {
+            "sentences": sentences,
+            "sentence_offsets": np.asarray(offsets),
+            "sentence_vectorizer": vectorizer,
+            "sentence_matrix": matrix
         }
     
+    def _save_document(self, document_id: str):
+        """Write a document's index and chunks to the cache directory"""
+        doc_data = self.vector_store[document_id]
+        base_path = os.path.join(self.cache_dir, document_id)
+        
+        def write_pickle(path: str):
+            with open(path, "wb") as f:
+                pickle.dump({key: value for key, value in doc_data.items() if key != "index"}, f)
+        
+        try:
+            if "index" in doc_data:
+                self._write_atomic(base_path + ".faiss", lambda path: faiss.write_index(doc_data["index"], path))
+            self._write_atomic(base_path + ".pkl", write_pickle)
+        except Exception as e:
+            print(f"Could not persist document {document_id}: {e}")
+    
+    def _write_atomic(self, path: str, write):
+        """Call write() on a unique temp file, then rename it over path"""
+        # A loaded index may be memory-mapped from the old file, which must not be
+        # truncated underneath it; unique names keep concurrent saves apart
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+    
+    def _load_document(self, document_id: str) -> Optional[Dict]:
+        """Read a document previously written by _save_document, if present"""
+        if not self._DOCUMENT_ID_RE.fullmatch(document_id):
+            return None
+        base_path = os.path.join(self.cache_dir, document_id)
+        try:
+            with open(base_path + ".pkl", "rb") as f:
+                doc_data = pickle.load(f)
+            if "embeddings" not in doc_data:
+                if faiss is None:
+                    return None
+                # Memory-map the index: only the pages searches touch are read into RAM
+                doc_data["index"] = faiss.read_index(
+                    base_path + ".faiss",
+                    faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                )
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Could not load cached document {document_id}: {e}")
+            return None
+        
+        self.vector_store[document_id] = doc_data
+        return doc_data
+    
+    def _load_cached_documents(self):
+        """Load every document found in the cache directory"""
+        for filename in os.listdir(self.cache_dir):
+            document_id, ext = os.path.splitext(filename)
+            if ext == ".pkl":
+                self._load_document(document_id)
+    
+    def _get_document(self, document_id: str) -> Dict:
+        """Return a document's store entry, loading it from the cache on a miss"""
+        doc_data = self.vector_store.get(document_id)
+        if doc_data is None:
+            doc_data = self._load_document(document_id)
+        if doc_data is None:
+            raise ValueError(f"Document {document_id} not found in index")
+        return doc_data
+    
+    def _get_encode_pool(self):
+        """Start the CPU encode pool on first use; None when encoding stays in-process"""
+        with self._encode_pool_lock:
+            if self._encode_pool is None and self.encode_workers:
+                try:
+                    self._encode_pool = self.embedding_model.start_multi_process_pool(
+                        target_devices=["cpu"] * self.encode_workers
+                    )
+                    atexit.register(self.embedding_model.stop_multi_process_pool, self._encode_pool)
+                except Exception as e:
+                    print(f"Multi-process encoding unavailable: {e}, encoding in-process")
+                    self.encode_workers = 0
+            return self._encode_pool
+    
+    def _build_index(self, embeddings: np.ndarray):
+        """Build an inner-product FAISS index sized to the number of vectors"""
+        if len(embeddings) < self.ann_min_vectors:
+            index = faiss.IndexFlatIP(self.embedding_dim)
+        else:
+            index = faiss.index_factory(self.embedding_dim, self.index_factory, faiss.METRIC_INNER_PRODUCT)
+            if not index.is_trained:  # IVF/PQ variants learn centroids first
+                index.train(embeddings)
+            if hasattr(index, "hnsw"):
+                index.hnsw.efSearch = self.hnsw_ef_search
+            else:
+                faiss.ParameterSpace().set_index_parameter(index, "nprobe", self.ivf_nprobe)
+        
+        index.add(embeddings)
+        return index
+    
     def retrieve(
         self, 
         query: str, 
@@ -57,31 +296,58 @@ class RAGSystem:
         Returns:
             Tuple of (relevant_chunks, similarity_scores)
         """
-        if document_id not in self.vector_store:
-            raise ValueError(f"Document {document_id} not found in index")
+        doc_data = self._get_document(document_id)
         
-        # Generate query embedding
-        query_embedding = self.embedding_model.encode([query], show_progress_bar=False)[0]
+        # Generate query embedding (repeat questions hit the cache)
+        query_embedding = self._embed_query(query)
         
-        # Get document embeddings
-        doc_data = self.vector_store[document_id]
-        chunk_embeddings = np.array(doc_data["embeddings"])
+        if "index" in doc_data:
+            # Inner-product search with FAISS's own top-k selection
+            index = doc_data["index"]
+            scores, indices = index.search(query_embedding, min(top_k, index.ntotal))
+            
+            relevant_chunks = [doc_data["chunks"][idx] for idx in indices[0]]
+            return relevant_chunks, scores[0].tolist()
         
-        # Calculate cosine similarity
-        similarities = self._cosine_similarity(
-            query_embedding.reshape(1, -1),
-            chunk_embeddings
-        )[0]
+        # Get document embeddings (already normalized at index time)
+        chunk_embeddings = doc_data["embeddings"]
         
-        # Get top-k most similar chunks
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        # Cosine similarity of unit vectors is a single matrix-vector product
+        similarities = chunk_embeddings @ query_embedding[0]
+        
+        # Get top-k most similar chunks: partial selection, then order only the k survivors
+        k = min(top_k, similarities.shape[0])
+        top_indices = np.argpartition(-similarities, k - 1)[:k]
+        top_indices = top_indices[np.argsort(-similarities[top_indices])]
         
         relevant_chunks = [doc_data["chunks"][idx] for idx in top_indices]
         similarity_scores = [float(similarities[idx]) for idx in top_indices]
         
         return relevant_chunks, similarity_scores
     
-    def generate_answer(
+    def _embed_query(self, query: str) -> np.ndarray:
+        """Return the normalized (1, dim) query embedding, cached per query text"""
+        with self._query_cache_lock:
+            cached = self._query_cache.get(query)
+            if cached is not None:
+                self._query_cache.move_to_end(query)
+                return cached
+        
+        embedding = self.embedding_model.encode(
+            [query],
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        ).astype(np.float32, copy=False)
+        embedding.flags.writeable = False  # Shared between callers
+        
+        with self._query_cache_lock:
+            self._query_cache[query] = embedding
+            if len(self._query_cache) > self.QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return embedding
+    
+    async def generate_answer(
         self,
         question: str,
         context_chunks: List[Dict],
@@ -93,23 +359,14 @@ class RAGSystem:
         Returns:
             Tuple of (answer, confidence_score)
         """
-        # Combine context chunks
-        context = "\n\n".join([chunk["text"] for chunk in context_chunks])
-        
-        # Create prompt for LLM
-        prompt = f"""You are an AI assistant that answers questions about logistics documents.
-Answer ONLY based on the provided document context. If the answer is not in the context, say "I cannot find this information in the document."
-
-Document Context:
-{context}
-
-Question: {question}
-
-Answer:"""
+        # Combine context chunks in document order so repeat retrievals of the
+        # same chunks yield an identical prompt prefix (cacheable by the provider)
+        ordered_chunks = sorted(context_chunks, key=lambda chunk: chunk["index"])
+        context = "\n\n".join([chunk["text"] for chunk in ordered_chunks])
         
         # Call LLM API
         if self.llm_api_key:
-            answer = self._call_llm_api(prompt)
+            answer = await self._call_llm_api(context, question)
         else:
             # Fallback to simple extraction if no API key
             answer = self._simple_answer_extraction(question, context_chunks)
@@ -119,7 +376,7 @@ Answer:"""
         
         return answer, confidence
     
-    def _call_llm_api(self, prompt: str) -> str:
+    async def _call_llm_api(self, context: str, question: str) -> str:
         """Call OpenRouter LLM API"""
         try:
             headers = {
@@ -127,16 +384,29 @@ Answer:"""
                 "Content-Type": "application/json"
             }
             
+            # Stable instructions + document context go first as the system message;
+            # only the question varies between calls on the same document
+            system_text = f"""You are an AI assistant that answers questions about logistics documents.
+Answer ONLY based on the provided document context. If the answer is not in the context, say "I cannot find this information in the document."
+
+Document Context:
+{context}"""
+            system_block = {"type": "text", "text": system_text}
+            if self.llm_model.startswith("anthropic/"):
+                # Anthropic needs an explicit breakpoint; other providers cache prefixes automatically
+                system_block["cache_control"] = {"type": "ephemeral"}
+            
             payload = {
                 "model": self.llm_model,
                 "messages": [
-                    {"role": "user", "content": prompt}
+                    {"role": "system", "content": [system_block]},
+                    {"role": "user", "content": f"Question: {question}\n\nAnswer:"}
                 ],
                 "temperature": 0.1,  # Low temperature for factual answers
                 "max_tokens": 500
             }
             
-            response = requests.post(self.llm_api_url, json=payload, headers=headers, timeout=30)
+            response = await self._http.post(self.llm_api_url, json=payload, headers=headers)
             response.raise_for_status()
             
             result = response.json()
@@ -148,23 +418,28 @@ Answer:"""
     
     def _simple_answer_extraction(self, question: str, context_chunks: List[Dict]) -> str:
         """Simple keyword-based answer extraction (fallback)"""
-        question_lower = question.lower()
-        keywords = set(question_lower.split())
+        not_found = "I cannot find this information in the document."
+        if not context_chunks:
+            return not_found
         
-        # Find most relevant sentence from context
-        best_sentence = ""
-        best_score = 0
+        doc_data = self._get_document(context_chunks[0]["document_id"])
+        vectorizer = doc_data["sentence_vectorizer"]
+        if vectorizer is None:
+            return not_found
         
-        for chunk in context_chunks:
-            sentences = chunk["text"].split(". ")
-            for sentence in sentences:
-                sentence_lower = sentence.lower()
-                score = sum(1 for keyword in keywords if keyword in sentence_lower)
-                if score > best_score:
-                    best_score = score
-                    best_sentence = sentence
+        # Sentence rows of the retrieved chunks, in relevance order
+        offsets = doc_data["sentence_offsets"]
+        rows = np.concatenate([
+            np.arange(offsets[chunk["index"]], offsets[chunk["index"] + 1])
+            for chunk in context_chunks
+        ])
         
-        return best_sentence if best_sentence else "I cannot find this information in the document."
+        # Shared keyword count per sentence in one sparse product; first best sentence wins
+        keywords = vectorizer.transform([question])
+        scores = (doc_data["sentence_matrix"][rows] @ keywords.T).toarray().ravel()
+        best = int(scores.argmax())
+        
+        return doc_data["sentences"][rows[best]] if scores[best] > 0 else not_found
     
     def _calculate_confidence(
         self,
@@ -181,45 +456,34 @@ Answer:"""
         if not similarity_scores:
             return 0.0
         
-        # Base confidence from average similarity
-        avg_similarity = np.mean(similarity_scores)
+        # Base confidence from average similarity (plain float math beats NumPy for a few scores)
+        avg_similarity = statistics.fmean(similarity_scores)
         
-        # Boost if multiple chunks agree (high similarity across chunks)
-        similarity_std = np.std(similarity_scores)
+        # Boost if multiple chunks agree (high similarity across chunks); population std
+        similarity_std = (
+            sum((score - avg_similarity) ** 2 for score in similarity_scores) / len(similarity_scores)
+        ) ** 0.5
         agreement_boost = 1.0 - min(similarity_std, 0.3)  # Lower std = higher agreement
         
         # Check if answer contains key terms from question
         answer_lower = answer.lower()
         question_terms = set()
         for chunk in context_chunks[:2]:  # Check top 2 chunks
-            words = chunk["text"].lower().split()
-            question_terms.update(words[:10])  # Top words
+            top_words = chunk.get("_top_words")
+            if top_words is None:
+                top_words = chunk["text"].lower().split()[:10]
+            question_terms.update(top_words)  # Top words
         
         coverage = sum(1 for term in question_terms if term in answer_lower) / max(len(question_terms), 1)
         coverage_boost = min(coverage * 0.2, 0.2)
         
         # Penalize if answer indicates missing information
-        if any(phrase in answer_lower for phrase in ["cannot find", "not in", "not available", "not found"]):
-            penalty = 0.5
-        else:
-            penalty = 1.0
+        penalty = 0.5 if self._MISSING_RE.search(answer) else 1.0
         
         # Combine factors
         confidence = (avg_similarity * 0.6 + agreement_boost * 0.2 + coverage_boost) * penalty
         return min(max(confidence, 0.0), 1.0)
     
-    def _cosine_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> np.ndarray:
-        """Calculate cosine similarity between vectors"""
-        # Normalize vectors
-        vec1_norm = vec1 / (np.linalg.norm(vec1, axis=1, keepdims=True) + 1e-8)
-        vec2_norm = vec2 / (np.linalg.norm(vec2, axis=1, keepdims=True) + 1e-8)
-        
-        # Calculate cosine similarity
-        similarity = np.dot(vec1_norm, vec2_norm.T)
-        return similarity
-    
     def get_document_text(self, document_id: str) -> str:
         """Get full document text"""
-        if document_id not in self.vector_store:
-            raise ValueError(f"Document {document_id} not found")
-        return self.vector_store[document_id]["full_text"]
+        return self._get_document(document_id)["full_text"]